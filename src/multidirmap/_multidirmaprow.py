@@ -1,61 +1,111 @@
 """MultiDirMapRow is an object that holds a row of entries in a MultiDirMap.
 
-The object uses slots to prevent arbitrary attributes being added (and to save
-space for Python versions that do not yet implement key-sharing dicts). Since
-the slots required depend on the parent MultiDirMap, the class is dynamically
-generated via generate_row_class().
+The object uses slots to prevent arbitrary attributes being added and to save
+space. The values of a row are stored positionally in a list. For fast reads
+with dot notation, rows are instances of a subclass with one read-only
+property per column, which is generated via generate_row_class() once per
+tuple of columns.
 """
+import functools
 
 
-class MultiDirMapRowBase(object):
+class MultiDirMapRow(object):
     """An entry in a MultiDirMap.
 
-    Attributes are given as slots. _parent holds a reference to the
-    MultiDirMap instance for which this class was created so that a
-    change to a MultiDirMapRow instance can trigger an update of the
-    parent.
+    _parent holds a reference to the MultiDirMap instance to which this row
+    belongs so that a change to a MultiDirMapRow instance can trigger an
+    update of the parent. _values holds the entries of the row in the order
+    of the parent's columns.
     """
 
-    __slots__ = ["_parent"]
+    __slots__ = ("_parent", "_values")
 
     def __init__(self, parent, values):
         """Create a row in a MultiDirMap.
 
         parent is a link back to the map to which this row belongs
-        values is a dict with the values for this row
+        values is a list with the values for this row in column order
         """
-        # Need to avoid own __setattr__ for this one assignment
-        super(MultiDirMapRowBase, self).__setattr__("_parent", parent)
-        for key, value in values.items():
-            super(MultiDirMapRowBase, self).__setattr__(key, value)
+        # Need to avoid own __setattr__ for the initial assignments
+        object.__setattr__(self, "_parent", parent)
+        object.__setattr__(self, "_values", values)
 
     def to_list(self):
         """Return contents as list in correct order."""
-        return [getattr(self, key) for key in self.__slots__]
+        return list(self._values)
 
     def to_dict(self):
         """Return contents as dict."""
-        return {key: getattr(self, key) for key in self.__slots__}
+        return dict(zip(self._parent._columns, self._values))
+
+    def __getattr__(self, attr):
+        """Raise AttributeError for anything that is not a column.
+
+        Columns are read through the properties of the generated subclass, so
+        this is only called for unknown names and for slots that are not yet
+        populated (e.g. during unpickling).
+        """
+        raise _no_attribute(attr)
 
     def __setattr__(self, attr, value):
         """Set value in this row and update the parent map accordingly."""
-        self._parent._modify_row_attr(self, attr, value, getattr(self, attr))
-        super(MultiDirMapRowBase, self).__setattr__(attr, value)
+        try:
+            index = self._parent._col_index[attr]
+        except KeyError:
+            raise _no_attribute(attr) from None
+        self._parent._modify_row_attr(self, index, value)
 
     def __getitem__(self, key):
-        """Get value in this row."""
-        return getattr(self, key)
+        """Get value in this row.
+
+        Only column names are accepted, anything else raises AttributeError.
+        """
+        try:
+            return self._values[self._parent._col_index[key]]
+        except KeyError:
+            raise _no_attribute(key) from None
 
     def __setitem__(self, key, value):
         """Set value in this row and update the parent map accordingly."""
-        setattr(self, key, value)
+        try:
+            index = self._parent._col_index[key]
+        except KeyError:
+            raise _no_attribute(key) from None
+        self._parent._modify_row_attr(self, index, value)
 
     def __eq__(self, other):
         """Test equality."""
         if self is other:
             return True
-        return self.to_list() == other.to_list()
+        if not isinstance(other, MultiDirMapRow):
+            return NotImplemented
+        return self._values == other._values
+
+    # Rows are mutable, so they must not be hashable
+    __hash__ = None
 
-    def __ne__(self, other):
-        """Test inequality (required for Python 2)."""
-        return not self == other
+
+def _no_attribute(attr):
+    """Build the AttributeError raised for anything that is not a column."""
+    return AttributeError(
+        "'{}' object has no attribute '{}'".format(MultiDirMapRow.__name__, attr)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def generate_row_class(columns):
+    """Return the MultiDirMapRow subclass for a tuple of columns.
+
+    Each column gets a read-only property, writes still go through
+    MultiDirMapRow.__setattr__() so that the parent map is updated. Columns
+    whose names clash with an attribute of MultiDirMapRow are only accessible
+    by subscript.
+    """
+    namespace = {"__slots__": ()}
+    for index, col in enumerate(columns):
+        if not hasattr(MultiDirMapRow, col):
+            namespace[col] = property(
+                lambda self, index=index: self._values[index],
+                doc="Value in column {}.".format(col),
+            )
+    return type(MultiDirMapRow.__name__, (MultiDirMapRow,), namespace)
@@ -1,88 +1,49 @@
-"""Thin wrapper for dict or OrderedDict providing togglable read-only.
+"""Thin wrapper for dict that is read-only to the outside."""
 
-If the Python version keeps dict entries in insertion order, dict is used,
-otherwise OrderedDict.
-"""
+_READ_ONLY_MESSAGE = "This dictionary is read only!"
 
-import sys
 
-if (
-    sys.version_info[:3] >= (3, 6, 0)  # pragma: no cover
-    and sys.implementation.name == "cpython"
-) or sys.version_info >= (3, 7, 0):
-    _dicttype = dict
-else:  # pragma: no cover
-    from collections import OrderedDict
-
-    _dicttype = OrderedDict
-
-
-def if_not_read_only(f):
-    """Raise TypeError if decortd function is called while read only is True."""
-
-    def wrapper(*args):
-        if args[0]._read_only:
-            raise TypeError("This dictionary is read only!")
-        return f(*args)
-
-    return wrapper
-
-
-class ReadOnlyDict(_dicttype):
-    """A dictionary that can be toggled read-only.
+class ReadOnlyDict(dict):
+    """A dictionary that is read-only to the outside.
 
     Insertion order is maintained.
-    Most magic methods are simply redirected to the parent, but defined here
-    so they can be intercepted by @if_not_read_only.
-    __eq__ is always redirected to dict so that comparison is order-independent.
+    All methods that would modify the dict raise a TypeError.
+    The owning MultiDirMap modifies the dict through the underscored aliases
+    below, which point straight at the methods of dict and thus bypass the
+    read-only check without an extra Python-level call.
     """
 
-    _read_only = True
-
-    def _set_read_only(self, read_only):
-        """Toggle read only on or off."""
-        self._read_only = read_only
+    _setitem = dict.__setitem__
+    _delitem = dict.__delitem__
+    _clear = dict.clear
+    _pop = dict.pop
+    _popitem = dict.popitem
+    _update = dict.update
 
-    @if_not_read_only
     def __setitem__(self, key, value):
-        """Redirects to __setitem__() of parent."""
-        super(ReadOnlyDict, self).__setitem__(key, value)
+        """Raise TypeError, the dict is read-only."""
+        raise TypeError(_READ_ONLY_MESSAGE)
 
-    @if_not_read_only
     def __delitem__(self, key):
-        """Redirects to __delitem__() of parent."""
-        super(ReadOnlyDict, self).__delitem__(key)
+        """Raise TypeError, the dict is read-only."""
+        raise TypeError(_READ_ONLY_MESSAGE)
 
-    @if_not_read_only
     def clear(self):
-        """Redirects to clear() of parent."""
-        super(ReadOnlyDict, self).clear()  # pragma: no cover
+        """Raise TypeError, the dict is read-only."""
+        raise TypeError(_READ_ONLY_MESSAGE)
 
-    @if_not_read_only
     def pop(self, key, *args):
-        """Redirects to pop() of parent."""
-        return super(ReadOnlyDict, self).pop(key, *args)  # pragma: no cover
+        """Raise TypeError, the dict is read-only."""
+        raise TypeError(_READ_ONLY_MESSAGE)
 
-    @if_not_read_only
     def popitem(self):
-        """Redirects to popitem() of parent."""
-        return super(ReadOnlyDict, self).popitem()
+        """Raise TypeError, the dict is read-only."""
+        raise TypeError(_READ_ONLY_MESSAGE)
 
-    @if_not_read_only
     def setdefault(self, key, failobj=None):
-        """Redirects to setdefault() of parent."""
-        super(ReadOnlyDict, self).setdefault(key, failobj)  # pragma: no cover
+        """Raise TypeError, the dict is read-only."""
+        raise TypeError(_READ_ONLY_MESSAGE)
 
-    @if_not_read_only
     def update(self, *args, **kwargs):
-        """Redirects to update() of parent."""
-        super(ReadOnlyDict, self).update(*args, **kwargs)  # pragma: no cover
-
-    def __eq__(self, other):
-        """Redirects to __eq__() of dict.
-
-        This redirection never points to OrderedDict to ensure comparisons are
-        always order-insensitive, i.e. behaviour doesn't differ between Python
-        versions.
-        """
-        return dict.__eq__(self, other)
+        """Raise TypeError, the dict is read-only."""
+        raise TypeError(_READ_ONLY_MESSAGE)
@@ -1,8 +1,7 @@
 """A multidirectional mapping with an arbitrary number of key columns."""
 import copy
-from contextlib import contextmanager
 
-from ._multidirmaprow import MultiDirMapRowBase
+from ._multidirmaprow import generate_row_class
 from ._read_only_dict import ReadOnlyDict
 from ._util import DuplicateKeyError
 from ._util import Overwrite
@@ -11,6 +10,25 @@ from ._util import Overwrite
 class MultiDirMap(object):
     """A multidirectional mapping with an arbitrary number of key columns."""
 
+    # The key dicts are set as attributes named after their columns, which
+    # requires __dict__, everything else lives in slots
+    __slots__ = (
+        "_columns",
+        "_col_index",
+        "_key_columns",
+        "_key_col_names",
+        "_key_dicts",
+        "_key_dicts_list",
+        "_primary_key_dict",
+        "_max_width",
+        "_max_cols",
+        "_max_col_width",
+        "_print_cache",
+        "_row_class",
+        "__dict__",
+        "__weakref__",
+    )
+
     def __init__(self, columns, key_columns=None, data=None):
         """Create multidirectional mapping.
 
@@ -19,19 +37,23 @@ class MultiDirMap(object):
         columns that the mapping can be indexed by.
         data initializes the mapping with the data provided (see also update()).
         """
-
-        class MultiDirMapRow(MultiDirMapRowBase):
-            __slots__ = columns
-
-        self._MultiDirMapRow = MultiDirMapRow
-        self._columns = columns
+        self._columns = tuple(columns)
+        # Rows store their values positionally, this maps column names to positions
+        self._col_index = {col: i for i, col in enumerate(self._columns)}
+        self._row_class = generate_row_class(self._columns)
         self._key_columns = key_columns or len(columns)
-        self._print_settings = {"max_width": 80, "max_cols": 4, "max_col_width": 20}
+        self._max_width = 80
+        self._max_cols = 4
+        self._max_col_width = 20
+        self._print_cache = None
+        self._key_col_names = self._columns[: self._key_columns]
         # For easier internal access than getattr
         self._key_dicts = {}
-        for colname in columns[:key_columns]:
+        for colname in self._key_col_names:
             setattr(self, colname, ReadOnlyDict())
             self._key_dicts[colname] = getattr(self, colname)
+        # Key dicts in column order for positional access in the hot loops
+        self._key_dicts_list = [self._key_dicts[col] for col in self._key_col_names]
         # Primary key dict needs to be accessed frequently
         self._primary_key_dict = self._key_dicts[self._columns[0]]
         if data:
@@ -51,13 +73,13 @@ class MultiDirMap(object):
         Both the entry in the primary key dict and consequently orphaned
         entries in the secondary key dicts are deleted.
         """
-        with self._writable():
-            item = self._primary_key_dict.get(key)
-            if not item:
-                raise KeyError(key)
-            for col, key in item.to_dict().items():
-                if col in self._key_dicts:
-                    del self._key_dicts[col][key]
+        item = self._primary_key_dict.get(key)
+        if item is None:
+            raise KeyError(key)
+        key_dicts = self._key_dicts_list
+        values = item._values
+        for i in range(self._key_columns):
+            key_dicts[i]._delitem(values[i])
 
     def __len__(self):
         """Return number of entries in the mapping."""
@@ -75,10 +97,6 @@ class MultiDirMap(object):
             and (self._primary_key_dict == other._primary_key_dict)
         )
 
-    def __ne__(self, other):
-        """Test inequality (required for Python 2)."""
-        return not self == other
-
     def __iter__(self):
         """Iterate over entries in the primary key dict."""
         return iter(self._primary_key_dict)
@@ -90,46 +108,25 @@ class MultiDirMap(object):
         to the left of the last column and replaced by "...") are determined
         by the print settings.
         """
-        n_output_cols = min(self._print_settings["max_cols"], len(self._columns))
-        n_omitted_cols = max(len(self._columns) - self._print_settings["max_cols"], 0)
-        col_width = min(
-            self._print_settings["max_col_width"],
-            (
-                self._print_settings["max_width"]
-                - 3 * n_omitted_cols
-                - (n_output_cols + n_omitted_cols - 1)
-            )
-            // n_output_cols,
-        )
-        total_width = (
-            n_output_cols * col_width
-            + (n_output_cols + n_omitted_cols - 1)
-            + n_omitted_cols * 3
-        )
-        pad_format = "{:" + str(col_width) + "." + str(col_width) + "}"
-        headers = [
-            pad_format.format(name[: col_width - 1] + "*")
-            for name in self._columns[: self._key_columns]
-        ] + [
-            pad_format.format(name[:col_width])
-            for name in self._columns[self._key_columns :]
-        ]
-        if n_omitted_cols > 0:
-            headers = headers[: n_output_cols - 1] + ["...", headers[-1]]
+        if self._print_cache is None:
+            self._print_cache = self._build_print_header()
+        col_width, n_output_cols, headers, separator = self._print_cache
 
-        output = [headers, [total_width * "="]]
+        output = [headers, [separator]]
         for row in self._primary_key_dict.values():
-            entries = row.to_list()
+            entries = row._values
             if len(headers) > n_output_cols:
                 output.append(
                     [
-                        pad_format.format(str(value)[:col_width])
+                        str(value)[:col_width].ljust(col_width)
                         for value in entries[: n_output_cols - 1]
                     ]
-                    + ["...", pad_format.format(str(entries[-1])[:col_width])]
+                    + ["...", str(entries[-1])[:col_width].ljust(col_width)]
                 )
             else:
-                output.append([pad_format.format(str(value)) for value in entries])
+                output.append(
+                    [str(value)[:col_width].ljust(col_width) for value in entries]
+                )
 
         return "\n".join([" ".join(row) for row in output])
 
@@ -156,7 +153,7 @@ class MultiDirMap(object):
         consequently orphaned entries are removed from the secondary key dicts.
         """
         item = self._primary_key_dict.get(key)
-        if not item:
+        if item is None:
             if default is self.__marker:
                 raise KeyError(key)
             return default
@@ -171,11 +168,12 @@ class MultiDirMap(object):
         """
         if len(self._primary_key_dict) == 0:
             raise KeyError
-        with self._writable():
-            item = self._primary_key_dict.popitem()
-            for col, key in item[1].to_dict().items():
-                if col in self._key_dicts and col != self._columns[0]:
-                    del self._key_dicts[col][key]
+        item = self._primary_key_dict._popitem()
+        key_dicts = self._key_dicts_list
+        values = item[1]._values
+        # The primary key (index 0) has already been removed by popitem
+        for i in range(1, self._key_columns):
+            key_dicts[i]._delitem(values[i])
         return item
 
     def keys(self):
@@ -192,9 +190,8 @@ class MultiDirMap(object):
 
     def clear(self):
         """Clear all key dicts, thereby deleting all stored data."""
-        with self._writable():
-            for key_dict in self._key_dicts.values():
-                key_dict.clear()
+        for key_dict in self._key_dicts_list:
+            key_dict._clear()
 
     def update(self, data, overwrite=Overwrite.PRIMARY, skip_duplicates=False):
         """Update the map with the provided data.
@@ -204,21 +201,33 @@ class MultiDirMap(object):
         conflicts with an existing entry.
         skip_duplicates determines whether a conflicting entry that will not
         overwrite should be skipped. If False, an exception will be raised in
-        that situation and a rollback performed, so that the update() operation
-        does not change the state of the map.
+        that situation before any change is made, so that the update()
+        operation does not change the state of the map.
         """
         data = self._format_data(data)
-        added_entries = []
-        backups = []
-        to_delete = {col: set() for col in self._columns[: self._key_columns]}
-        with self._writable():
-            for row in data:
-                self._add_entry(
-                    row, added_entries, backups, to_delete, overwrite, skip_duplicates
-                )
-            for col, keys in to_delete.items():
-                for key in keys:
-                    del self._key_dicts[col][key]
+        key_dicts = self._key_dicts_list
+        key_columns = self._conflict_free_key_columns(data)
+        if key_columns is not None:
+            row_class = self._row_class
+            rows = [row_class(self, row) for row in data]
+            for key_dict, keys in zip(key_dicts, key_columns):
+                key_dict._update(zip(keys, rows))
+            return
+        # For updates that are large compared to the map, plan on copies of the
+        # key dicts, so that a key already in the map is found with a single
+        # lookup instead of missing the pending changes first. This costs a
+        # copy and a refill of every key dict, and lookups of new keys do not
+        # get any cheaper
+        snapshot = 2 * len(data) >= len(self)
+        pending, to_delete = self._plan_update(
+            data, overwrite, skip_duplicates, snapshot
+        )
+        for key_dict, new_keys in zip(key_dicts, pending):
+            if snapshot:
+                key_dict._clear()
+            key_dict._update(new_keys)
+        for i, key in to_delete:
+            key_dicts[i]._pop(key, None)
 
     def print_settings(self, **kwargs):
         """Change the print settings for __str__().
@@ -227,9 +236,10 @@ class MultiDirMap(object):
         max_cols gives the maximum number of columns.
         max_col width gives the maximum width of each column.
         """
-        for setting in ["max_width", "max_cols", "max_col_width"]:
-            if setting in kwargs and type(kwargs[setting]) is int:
-                self._print_settings[setting] = kwargs[setting]
+        for setting in ("max_width", "max_cols", "max_col_width"):
+            if type(kwargs.get(setting)) is int:
+                setattr(self, "_" + setting, kwargs[setting])
+        self._print_cache = None
 
     def reorder_secondary_keys(self):
         """Refresh the order of the secondary key dicts.
@@ -239,13 +249,7 @@ class MultiDirMap(object):
         key order can get scrambled when secondary entries are
         overwritten.
         """
-        with self._writable():
-            for secondary_key_column in self._columns[1 : self._key_columns]:
-                self._key_dicts[secondary_key_column].clear()
-                for entry in self._primary_key_dict.values():
-                    self._key_dicts[secondary_key_column][
-                        entry[secondary_key_column]
-                    ] = entry
+        self._refill_key_dicts(list(self._primary_key_dict.values()), 1)
 
     def sort(self, key=lambda entry: entry.to_list()[0], reverse=False):
         """Sort the map by the given key.
@@ -253,24 +257,67 @@ class MultiDirMap(object):
         If no key is given, sorting is done by the entries in the primary
         key column.
         """
-        ordered_values = [
-            value.to_dict()
-            for value in sorted(
-                self._primary_key_dict.values(), key=key, reverse=reverse
-            )
-        ]
-        self.clear()
-        self.update(ordered_values)
+        self._refill_key_dicts(
+            sorted(self._primary_key_dict.values(), key=key, reverse=reverse)
+        )
 
     def to_list(self):
         """Dump all the contents of the map into a list of lists."""
         return [entry.to_list() for entry in self._primary_key_dict.values()]
 
+    def _build_print_header(self):
+        """Compute the parts of __str__() that depend only on the print settings.
+
+        Returns a tuple (col_width, n_output_cols, headers, separator), which
+        __str__() caches until print_settings() is called.
+        """
+        n_output_cols = min(self._max_cols, len(self._columns))
+        n_omitted_cols = max(len(self._columns) - self._max_cols, 0)
+        col_width = min(
+            self._max_col_width,
+            (
+                self._max_width
+                - 3 * n_omitted_cols
+                - (n_output_cols + n_omitted_cols - 1)
+            )
+            // n_output_cols,
+        )
+        total_width = (
+            n_output_cols * col_width
+            + (n_output_cols + n_omitted_cols - 1)
+            + n_omitted_cols * 3
+        )
+        headers = [
+            (name[: col_width - 1] + "*").ljust(col_width)
+            for name in self._columns[: self._key_columns]
+        ] + [
+            name[:col_width].ljust(col_width)
+            for name in self._columns[self._key_columns :]
+        ]
+        if n_omitted_cols > 0:
+            headers = headers[: n_output_cols - 1] + ["...", headers[-1]]
+        return col_width, n_output_cols, headers, total_width * "="
+
+    def _refill_key_dicts(self, entries, first_column=0):
+        """Refill the key dicts from first_column on with entries in order.
+
+        The existing rows are reused and each key dict is rebuilt in place
+        with a single update(), so references to the key dicts stay valid.
+        """
+        for i in range(first_column, self._key_columns):
+            key_dict = self._key_dicts_list[i]
+            key_dict._clear()
+            key_dict._update((entry._values[i], entry) for entry in entries)
+
     def _format_data(self, data):
         """Transform input data into a list of lists.
 
         If the input data is not in an accepted format, a ValueError is raised.
         """
+        if (isinstance(data, list) or isinstance(data, tuple)) and data:
+            shaped_data = self._format_uniform_data(data)
+            if shaped_data is not None:
+                return shaped_data
         shaped_data = []
         if isinstance(data, list) or isinstance(data, tuple):
             for row in data:
@@ -279,7 +326,9 @@ class MultiDirMap(object):
                         raise ValueError(
                             "Encountered malformed data updating MultiDirMap:", row
                         )
-                    shaped_data.append(row + [None] * (len(self._columns) - len(row)))
+                    shaped_data.append(
+                        list(row) + [None] * (len(self._columns) - len(row))
+                    )
                 elif isinstance(row, dict):
                     if not set(self._columns[: self._key_columns]) <= set(row):
                         raise ValueError(
@@ -305,7 +354,7 @@ class MultiDirMap(object):
                         )
                     shaped_data.append(
                         [primary_key]
-                        + row
+                        + list(row)
                         + [None] * (len(self._columns) - len(row) - 1)
                     )
                 else:
@@ -318,116 +367,152 @@ class MultiDirMap(object):
             raise ValueError("Encountered unexpected data format updating MultiDirMap.")
         return shaped_data
 
-    def _add_entry(
-        self, row, added_entries, backups, to_delete, overwrite, skip_duplicates
-    ):
-        """Add an entry to the map."""
-        entries = dict(zip(self._columns, row))
-        new_entry = self._MultiDirMapRow(self, entries)
-        duplicates = {
-            col: key in self._key_dicts[col]
-            for col, key in entries.items()
-            if col in self._key_dicts
-        }
-        if not any(duplicates.values()):
-            added_entry = {}
-            for col, key in entries.items():
-                if col in self._key_dicts:
-                    self._key_dicts[col][key] = new_entry
-                    added_entry[col] = key
-            added_entries.append(added_entry)
-            return
-        # For any constellation that would not allow inserting the new entry we
-        # either skip the entry or roll back and raise an error depending on
-        # whether skip_duplicates is True
-        if not self._is_duplicate_overwritable(overwrite, duplicates):
-            if skip_duplicates:
-                return
-            else:
-                self._rollback(added_entries, backups)
+    def _format_uniform_data(self, data):
+        """Transform a list of uniformly shaped rows into a list of lists.
+
+        This is a fast path for the common bulk-load case of a list of
+        complete lists / tuples or of dicts with all key columns present. The
+        type of the first row determines which specialized loop is used. If
+        any row does not fit, None is returned and _format_data() falls back
+        to checking row by row (and raising the appropriate error).
+        """
+        row_type = type(data[0])
+        if row_type is list or row_type is tuple:
+            n_columns = len(self._columns)
+            if all(type(row) is row_type and len(row) == n_columns for row in data):
+                return [list(row) for row in data]
+        elif row_type is dict and all(type(row) is dict for row in data):
+            columns = self._columns
+            shaped_data = [[row.get(col) for col in columns] for row in data]
+            if not any(None in row[: self._key_columns] for row in shaped_data):
+                return shaped_data
+        return None
+
+    def _conflict_free_key_columns(self, data):
+        """Return the key columns of data if it can be inserted without conflicts.
+
+        The keys of each key column are checked in bulk for uniqueness within
+        data and for not being present in the map yet. If that holds for all
+        key columns, a list with the keys of each key column is returned,
+        otherwise None, in which case each row needs to be checked for key
+        conflicts individually.
+        """
+        key_columns = []
+        for i, key_dict in enumerate(self._key_dicts_list):
+            keys = [row[i] for row in data]
+            key_set = set(keys)
+            # dict_keys.isdisjoint() iterates over the smaller of the two
+            if len(key_set) != len(keys) or not key_dict.keys().isdisjoint(key_set):
+                return None
+            key_columns.append(keys)
+        return key_columns
+
+    def _plan_update(self, data, overwrite, skip_duplicates, snapshot):
+        """Determine the changes update() makes to the key dicts.
+
+        The map itself is not modified. Instead, a dict of keys to be
+        (over)written is built up for each key column, in the order of
+        _key_dicts_list, along with the set of (key column index, key) pairs
+        orphaned by overwrites. Both are returned as (pending, to_delete).
+        Keys are looked up in the pending changes before the key dicts, so
+        later rows see the effect of earlier rows in the same update.
+        If snapshot is True, pending starts out as a copy of the key dicts
+        and replaces their contents on commit, otherwise it only holds the
+        changes and is merged into them.
+        If a conflicting row may neither overwrite nor be skipped, a
+        DuplicateKeyError is raised before anything has been committed.
+        """
+        # Bind attributes used in the loop below to locals once
+        key_columns = self._key_columns
+        is_duplicate_overwritable = self._is_duplicate_overwritable
+        row_class = self._row_class
+        if snapshot:
+            pending = [dict(key_dict) for key_dict in self._key_dicts_list]
+            key_dicts = [{} for _ in pending]
+        else:
+            key_dicts = self._key_dicts_list
+            pending = [{} for _ in key_dicts]
+        to_delete = set()
+        for row in data:
+            row_keys = row[:key_columns]
+            duplicates = [
+                key in new_keys or key in key_dict
+                for key_dict, new_keys, key in zip(key_dicts, pending, row_keys)
+            ]
+            if not any(duplicates):
+                new_entry = row_class(self, row)
+                for new_keys, key in zip(pending, row_keys):
+                    new_keys[key] = new_entry
+                continue
+            # For any constellation that would not allow inserting the new
+            # entry we either skip the entry or raise an error depending on
+            # whether skip_duplicates is True
+            if not is_duplicate_overwritable(overwrite, duplicates):
+                if skip_duplicates:
+                    continue
                 raise DuplicateKeyError(
                     "One or more keys in {} were duplicates".format(str(row))
                 )
-        self._determine_deletable(entries, duplicates, to_delete)
-        if overwrite == Overwrite.ALL:
-            for col, key in entries.items():
-                if col in self._key_dicts:
-                    self._key_dicts[col][key] = new_entry
-                    to_delete[col].discard(key)
-            return
-
-        # At this point, the only possibility is that there are duplicate keys
-        # that we can overwrite but may need to roll back
-        added_entry = {}
-        backup = {}
-        for col, key in entries.items():
-            if col in self._key_dicts:
-                if duplicates[col]:
-                    backup[key] = [col, self._key_dicts[col][key]]
-                else:
-                    added_entry[col] = key
-                self._key_dicts[col][key] = new_entry
-                to_delete[col].discard(key)
-        added_entries.append(added_entry)
-        backups.append(backup)
+            self._determine_deletable(
+                row_keys, duplicates, key_dicts, pending, to_delete
+            )
+            new_entry = row_class(self, row)
+            for i, key in enumerate(row_keys):
+                pending[i][key] = new_entry
+                to_delete.discard((i, key))
+        return pending, to_delete
 
     def _is_duplicate_overwritable(self, overwrite, duplicates):
         """Check whether overwriting an identified duplicate is permitted."""
         if overwrite == Overwrite.NONE:
             return False
-        if overwrite == Overwrite.PRIMARY and any(
-            [key for col, key in duplicates.items() if col != self._columns[0]]
-        ):
+        if overwrite == Overwrite.PRIMARY and any(duplicates[1:]):
             return False
-        if overwrite == Overwrite.SECONDARY and duplicates[self._columns[0]]:
+        if overwrite == Overwrite.SECONDARY and duplicates[0]:
             return False
         return True
 
-    def _determine_deletable(self, entries, duplicates, to_delete):
-        """Check which entries can be deleted at end of update() operation."""
-        for col, key in entries.items():
-            if col in self._key_dicts and duplicates[col]:
-                for i, val in enumerate(
-                    self._key_dicts[col][key].to_list()[: self._key_columns]
-                ):
-                    to_delete[self._columns[i]].add(val)
-
-    def _rollback(self, added_entries, backups):
-        """Roll back to state before current update() operation started."""
-        # First remove all the added entries so we don't get duplicate keys
-        # when restoring from backups
-        for added_entry in added_entries:
-            for col, key in added_entry.items():
-                del self._key_dicts[col][key]
-        for backup in backups:
-            for key, entry in backup.items():
-                self._key_dicts[entry[0]][key] = entry[1]
-
-    def _modify_row_attr(self, row, col, value, old_value):
+    def _determine_deletable(self, row_keys, duplicates, key_dicts, pending, to_delete):
+        """Check which entries can be deleted at end of update() operation.
+
+        Keys of an overwritten entry that have already been claimed by another
+        entry earlier in the same update are not deleted.
+        """
+        for key_dict, new_keys, key, duplicate in zip(
+            key_dicts, pending, row_keys, duplicates
+        ):
+            if duplicate:
+                entry = self._pending_lookup(key_dict, new_keys, key)
+                for i, val in enumerate(entry._values[: self._key_columns]):
+                    if self._pending_lookup(key_dicts[i], pending[i], val) is entry:
+                        to_delete.add((i, val))
+
+    @staticmethod
+    def _pending_lookup(key_dict, new_keys, key):
+        """Return the entry for key taking pending changes into account."""
+        entry = new_keys.get(key)
+        if entry is None:
+            entry = key_dict[key]
+        return entry
+
+    def _modify_row_attr(self, row, index, value):
         """Propagate modification of entry to all key dicts.
 
-        Called on modification of a MultiDirMapRow element's attribute.
-        Updates the appropriate key dicts to maintain consistentcy of the map.
+        Called on modification of a MultiDirMapRow element's attribute, with
+        index being the position of the modified column.
+        Updates the appropriate key dicts to maintain consistentcy of the map
+        and then sets the new value on the row.
         If there is a key conflict, a DuplicateKeyError exception is raised.
         """
-        if value == row[col] or col not in self._key_dicts:
-            return
-        if value in self._key_dicts[col]:
-            raise DuplicateKeyError(
-                'Attempting to set a key to "{}", which already exists in '
-                'column "{}"'.format(value, col)
-            )
-        with self._writable():
-            self._key_dicts[col][value] = row
-            del self._key_dicts[col][old_value]
-
-    @contextmanager
-    def _writable(self):
-        """Make ReadOnlyDicts temporarily writable."""
-        for keydict in self._key_dicts.values():
-            keydict._set_read_only(False)
-        try:
-            yield
-        finally:
-            for keydict in self._key_dicts.values():
-                keydict._set_read_only(True)
+        values = row._values
+        old_value = values[index]
+        if index < self._key_columns and not (value is old_value or value == old_value):
+            key_dict = self._key_dicts_list[index]
+            if value in key_dict:
+                raise DuplicateKeyError(
+                    'Attempting to set a key to "{}", which already exists in '
+                    'column "{}"'.format(value, self._columns[index])
+                )
+            key_dict._setitem(value, row)
+            key_dict._delitem(old_value)
+        values[index] = value
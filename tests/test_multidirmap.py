@@ -1,5 +1,7 @@
 """Test the functionality of a MultiDirMap."""
 import copy
+import functools
+from unittest import mock
 
 import pytest
 
@@ -7,30 +9,48 @@ from multidirmap import DuplicateKeyError
 from multidirmap import MultiDirMap
 from multidirmap import Overwrite
 
-pte_data = [
-    ["symbol", "name", "atomic_number", "isotope_masses"],
-    [
-        ["H", "Hydrogen", 1, [1, 2, 3]],
-        ["He", "Helium", 2, [4, 3]],
-        ["Li", "Lithium", 3, [7, 6]],
-        ["Be", "Beryllium", 4, [9, 10, 7]],
-        ["B", "Boron", 5, [11, 10]],
-        ["C", "Carbon", 6, [12, 13, 14, 11]],
-        ["N", "Nitrogen", 7, [14, 15, 13]],
-        ["O", "Oxygen", 8, [16, 18, 17]],
-        ["F", "Fluorine", 9, [19, 18]],
-        ["Ne", "Neon", 10, [20, 22, 21]],
-    ],
-]
+# Frozen as tuples so that no test can modify the reference data by accident.
+# isotope_masses stay lists, as the copy tests need a mutable value per row.
+pte_data = (
+    ("symbol", "name", "atomic_number", "isotope_masses"),
+    (
+        ("H", "Hydrogen", 1, [1, 2, 3]),
+        ("He", "Helium", 2, [4, 3]),
+        ("Li", "Lithium", 3, [7, 6]),
+        ("Be", "Beryllium", 4, [9, 10, 7]),
+        ("B", "Boron", 5, [11, 10]),
+        ("C", "Carbon", 6, [12, 13, 14, 11]),
+        ("N", "Nitrogen", 7, [14, 15, 13]),
+        ("O", "Oxygen", 8, [16, 18, 17]),
+        ("F", "Fluorine", 9, [19, 18]),
+        ("Ne", "Neon", 10, [20, 22, 21]),
+    ),
+)
 
 
 def get_default_map(from_index=0, to_index=10, key_columns=3):
-    """Generate a multidirmap for use in tests."""
+    """Generate a multidirmap for use in tests.
+
+    The isotope lists, the only mutable values in pte_data, are copied, so
+    tests are free to modify them. This is much cheaper than deep copying
+    the data or a finished map.
+    """
     return MultiDirMap(
-        pte_data[0], key_columns=key_columns, data=pte_data[1][from_index:to_index]
+        pte_data[0],
+        key_columns=key_columns,
+        data=[row[:-1] + (list(row[-1]),) for row in pte_data[1][from_index:to_index]],
     )
 
 
+@functools.lru_cache(maxsize=None)
+def get_reference_map(from_index=0, to_index=10, key_columns=3):
+    """Return a map that is built once per set of parameters and then shared.
+
+    Only for maps that are compared against, never for maps that are modified.
+    """
+    return get_default_map(from_index, to_index, key_columns)
+
+
 class TestInputFormats:
     """Test that all allowed input formats are handled properly."""
 
@@ -59,8 +79,27 @@ class TestInputFormats:
             "isotope_masses": [7, 6],
         },
     ]
+    lot_data = [
+        ("H", "Hydrogen", 1, [1, 2, 3]),
+        ("He", "Helium", 2, [4, 3]),
+        ("Li", "Lithium", 3, [7, 6]),
+    ]
+    mixed_data = [
+        ["H", "Hydrogen", 1, [1, 2, 3]],
+        {
+            "symbol": "He",
+            "name": "Helium",
+            "atomic_number": 2,
+            "isotope_masses": [4, 3],
+        },
+        ("Li", "Lithium", 3, [7, 6]),
+    ]
 
-    @pytest.mark.parametrize("data", [dol_data, lod_data], ids=["dol_data", "lod_data"])
+    @pytest.mark.parametrize(
+        "data",
+        [dol_data, lod_data, lot_data, mixed_data],
+        ids=["dol_data", "lod_data", "lot_data", "mixed_data"],
+    )
     def test_input_formats(self, data):
         """Test the various possible input formats."""
         map0 = MultiDirMap(pte_data[0], key_columns=3, data=pte_data[1][:3])
@@ -84,7 +123,7 @@ class TestPop:
         map0 = get_default_map()
         h = map0.pop("H")
         assert h.to_list() == ["H", "Hydrogen", 1, [1, 2, 3]]
-        assert map0 == get_default_map(from_index=1)
+        assert map0 == get_reference_map(from_index=1)
 
     def test_popitem(self):
         """Pop from end of map."""
@@ -92,7 +131,7 @@ class TestPop:
         ne = map0.popitem()
         assert ne[0] == "Ne"
         assert ne[1].to_list() == ["Ne", "Neon", 10, [20, 22, 21]]
-        assert map0 == get_default_map(to_index=9)
+        assert map0 == get_reference_map(to_index=9)
 
     def test_popitem_from_empty(self):
         """Pop from end of empty map."""
@@ -101,43 +140,33 @@ class TestPop:
             map0.popitem()
 
 
-class TestPreventModifications:
-    """Test that the read-only dicts prevent modification."""
+@pytest.fixture(scope="class")
+def ro_map():
+    """Map shared by all tests of a class, none of which can modify it."""
+    return get_default_map()
 
-    def test_prevent_assignment_to_keydict(self):
-        """Assignment to key dict not possible."""
-        with pytest.raises(TypeError):
-            get_default_map().symbol["He"] = "Hello world!"
 
-    def test_prevent_del_from_keydict(self):
-        """Deletion from key dict not possible."""
-        with pytest.raises(TypeError):
-            del get_default_map().symbol["He"]
-
-    def test_prevent_clear_keydict(self):
-        """Clearing key dict not possible."""
-        with pytest.raises(TypeError):
-            get_default_map().symbol.clear()
-
-    def test_prevent_pop_from_keydict(self):
-        """Pop from key dict not possible."""
-        with pytest.raises(TypeError):
-            get_default_map().symbol.pop("He")
-
-    def test_prevent_popitem_from_keydict(self):
-        """Popitem from key dict not possible."""
-        with pytest.raises(TypeError):
-            get_default_map().symbol.popitem()
-
-    def test_prevent_setdefault_to_keydict(self):
-        """Setdefault on key dict not possible."""
-        with pytest.raises(TypeError):
-            get_default_map().symbol.setdefault("He")
+class TestPreventModifications:
+    """Test that the read-only dicts prevent modification."""
 
-    def test_prevent_update_to_keydict(self):
-        """Update to key dict not possible."""
+    @pytest.mark.parametrize(
+        "operation",
+        [
+            lambda key_dict: key_dict.__setitem__("He", "Hello world!"),
+            lambda key_dict: key_dict.__delitem__("He"),
+            lambda key_dict: key_dict.clear(),
+            lambda key_dict: key_dict.pop("He"),
+            lambda key_dict: key_dict.popitem(),
+            lambda key_dict: key_dict.setdefault("He"),
+            lambda key_dict: key_dict.update({"U": ["Uranium", 91, []]}),
+        ],
+        ids=["assignment", "del", "clear", "pop", "popitem", "setdefault", "update"],
+    )
+    def test_prevent_modification_of_keydict(self, ro_map, operation):
+        """Modifying a key dict is not possible."""
         with pytest.raises(TypeError):
-            get_default_map().symbol.update({"U": ["Uranium", 91, []]})
+            operation(ro_map.symbol)
+        assert ro_map == get_reference_map()
 
 
 class TestReadAndWrite:
@@ -156,7 +185,7 @@ class TestReadAndWrite:
         """Setting an element via subscript."""
         map0 = get_default_map(to_index=9)
         map0["Ne"] = ["Neon", 10, [20, 22, 21]]
-        assert map0 == get_default_map()
+        assert map0 == get_reference_map()
 
     def test_magic_set_duplicate_key_error(self):
         """Assigning which would cause DuplicateKeyError fails."""
@@ -226,7 +255,7 @@ class TestIter:
 
     def test_iter(self):
         """Iteration over a MultiDirmap."""
-        assert [key for key in get_default_map()] == [
+        assert list(get_default_map()) == [
             "H",
             "He",
             "Li",
@@ -242,14 +271,16 @@ class TestIter:
     def test_keys(self):
         """Iteration over the keys."""
         map0 = get_default_map()
+        rows = pte_data[1]
         for i, key in enumerate(map0.keys()):
-            assert map0[key].to_list() == pte_data[1][i]
+            assert map0[key].to_list() == list(rows[i])
 
     def test_values(self):
         """Iteration over the values."""
         map0 = get_default_map()
+        rows = pte_data[1]
         for i, value in enumerate(map0.values()):
-            assert value.to_list() == pte_data[1][i]
+            assert value.to_list() == list(rows[i])
 
     def test_items(self):
         """Iteration over the items."""
@@ -268,41 +299,62 @@ class TestLen:
         assert len(map0) == length
 
 
+_DEFAULT_STR = (
+    "symbol*             name*               atomic_number*      isotope_masses     \n"  # noqa: E501
+    "===============================================================================\n"  # noqa: E501
+    "H                   Hydrogen            1                   [1, 2, 3]          \n"  # noqa: E501
+    "He                  Helium              2                   [4, 3]             \n"  # noqa: E501
+    "Li                  Lithium             3                   [7, 6]             \n"  # noqa: E501
+    "Be                  Beryllium           4                   [9, 10, 7]         \n"  # noqa: E501
+    "B                   Boron               5                   [11, 10]           \n"  # noqa: E501
+    "C                   Carbon              6                   [12, 13, 14, 11]   "  # noqa: E501
+)
+_COMPACT_STR = (
+    "symbol*   name*     ... isotope_m\n"
+    "=================================\n"
+    "H         Hydrogen  ... [1, 2, 3]\n"
+    "He        Helium    ... [4, 3]   \n"
+    "Li        Lithium   ... [7, 6]   \n"
+    "Be        Beryllium ... [9, 10, 7\n"
+    "B         Boron     ... [11, 10] \n"
+    "C         Carbon    ... [12, 13, "
+)
+
+
 class TestStr:
     """Test string output."""
 
-    default_str = (
-        "symbol*             name*               atomic_number*      isotope_masses     \n"  # noqa: E501
-        "===============================================================================\n"  # noqa: E501
-        "H                   Hydrogen            1                   [1, 2, 3]          \n"  # noqa: E501
-        "He                  Helium              2                   [4, 3]             \n"  # noqa: E501
-        "Li                  Lithium             3                   [7, 6]             \n"  # noqa: E501
-        "Be                  Beryllium           4                   [9, 10, 7]         \n"  # noqa: E501
-        "B                   Boron               5                   [11, 10]           \n"  # noqa: E501
-        "C                   Carbon              6                   [12, 13, 14, 11]   "  # noqa: E501
-    )
-    compact_str = (
-        "symbol*   name*     ... isotope_m\n"
-        "=================================\n"
-        "H         Hydrogen  ... [1, 2, 3]\n"
-        "He        Helium    ... [4, 3]   \n"
-        "Li        Lithium   ... [7, 6]   \n"
-        "Be        Beryllium ... [9, 10, 7\n"
-        "B         Boron     ... [11, 10] \n"
-        "C         Carbon    ... [12, 13, "
-    )
-
     @pytest.mark.parametrize(
         "print_settings, output",
-        [({}, default_str), ({"max_cols": 3, "max_col_width": 9}, compact_str)],
+        [({}, _DEFAULT_STR), ({"max_cols": 3, "max_col_width": 9}, _COMPACT_STR)],
         ids=["default settings", "compact"],
     )
     def test_str(self, print_settings, output):
         """Output MultiDirMap as string."""
         map0 = get_default_map(to_index=6)
+        assert str(map0) == _DEFAULT_STR
         map0.print_settings(**print_settings)
         assert str(map0) == output
 
+    def test_str_cache(self):
+        """The cached header follows row changes and print settings."""
+        map0 = get_default_map(to_index=6)
+        assert str(map0) == _DEFAULT_STR
+        assert str(map0) == _DEFAULT_STR
+        carbon = map0.pop("C").to_list()
+        assert str(map0) == _DEFAULT_STR.rsplit("\n", 1)[0]
+        map0.update([carbon])
+        assert str(map0) == _DEFAULT_STR
+        map0.print_settings(max_cols=3, max_col_width=9)
+        assert str(map0) == _COMPACT_STR
+        assert str(map0) == _COMPACT_STR
+
+
+@pytest.fixture(scope="class")
+def bad_input_map():
+    """Map shared by the invalid update tests, which leave it unchanged."""
+    return get_default_map(to_index=3)
+
 
 class TestUpdate:
     """Test the update method of a MultiDirMap."""
@@ -312,7 +364,7 @@ class TestUpdate:
         map0 = get_default_map(to_index=3)
         with pytest.raises(DuplicateKeyError):
             map0.update(pte_data[1][3:] + pte_data[1][0:1])
-        assert map0 == get_default_map(to_index=3)
+        assert map0 == get_reference_map(to_index=3)
 
     def test_overwrite_none_raises_exception_for_any_key_conflicts(self):
         """If overwrite is NONE, any duplicate key raises an exception."""
@@ -331,6 +383,25 @@ class TestUpdate:
         assert map0["He"] is map0.atomic_number[20]
         assert is_consistent(map0)
 
+    def test_duplicate_keys_within_update(self):
+        """Conflicts between rows of the same update are resolved in order."""
+        map0 = get_default_map(to_index=3)
+        map0.update(
+            [["Be", "NotBeryllium", 40, []], ["Be", "Beryllium", 4, [9, 10, 7]]]
+        )
+        assert is_consistent(map0)
+        assert map0 == get_reference_map(to_index=4)
+
+    def test_overwritten_entry_does_not_delete_reassigned_keys(self):
+        """Keys of an overwritten entry claimed earlier in the update are kept."""
+        map0 = get_default_map(to_index=3)
+        map0.update(
+            [["X", "X", 3, []], ["Y", "Lithium", 30, []]], overwrite=Overwrite.SECONDARY
+        )
+        assert is_consistent(map0)
+        assert map0.atomic_number[3].to_list() == ["X", "X", 3, []]
+        assert list(map0.keys()) == ["H", "He", "X", "Y"]
+
     def test_error_during_update_rolls_back_changes(self):
         """If an error occurs during update, all changes are rolled back."""
         map0 = get_default_map()
@@ -340,7 +411,7 @@ class TestUpdate:
                 overwrite=Overwrite.SECONDARY,
             )
         assert is_consistent(map0)
-        assert map0 == get_default_map()
+        assert map0 == get_reference_map()
         assert list(map0.symbol.keys()) == [
             "H",
             "He",
@@ -426,11 +497,11 @@ class TestUpdate:
             "non-collection",
         ],
     )
-    def test_bad_data_format(self, update_data):
+    def test_bad_data_format(self, bad_input_map, update_data):
         """An update with invalid data raises a ValueError."""
-        map0 = get_default_map(to_index=3)
         with pytest.raises(ValueError):
-            map0.update(update_data)
+            bad_input_map.update(update_data)
+        assert bad_input_map == get_reference_map(to_index=3)
 
 
 class TestEquality:
@@ -439,24 +510,24 @@ class TestEquality:
     @pytest.mark.parametrize(
         "map0, map1, equals",
         [
-            (get_default_map(), get_default_map(), True),
+            (get_default_map, get_default_map, True),
             (
-                get_default_map(),
-                MultiDirMap(pte_data[0], key_columns=3, data=pte_data[1][::-1]),
+                get_default_map,
+                lambda: MultiDirMap(pte_data[0], key_columns=3, data=pte_data[1][::-1]),
                 True,
             ),
-            (get_default_map(), get_default_map(key_columns=2), False),
+            (get_default_map, lambda: get_default_map(key_columns=2), False),
             (
-                get_default_map(from_index=0, to_index=0),
-                get_default_map(from_index=0, to_index=0, key_columns=2),
+                lambda: get_default_map(from_index=0, to_index=0),
+                lambda: get_default_map(from_index=0, to_index=0, key_columns=2),
                 False,
             ),
             (
-                get_default_map(from_index=0, to_index=0),
-                MultiDirMap(["symbol", "name", "atomic_number"], key_columns=3),
+                lambda: get_default_map(from_index=0, to_index=0),
+                lambda: MultiDirMap(["symbol", "name", "atomic_number"], key_columns=3),
                 False,
             ),
-            (get_default_map(), "Hello World", False),
+            (get_default_map, lambda: "Hello World", False),
         ],
         ids=[
             "same order",
@@ -468,7 +539,13 @@ class TestEquality:
         ],
     )
     def test_equal(self, map0, map1, equals):
-        """Behaviour of == and != operators."""
+        """Behaviour of == and != operators.
+
+        The maps are given as factories so that they are only built when the
+        test actually runs, not at collection time.
+        """
+        map0 = map0()
+        map1 = map1()
         assert (map0 == map1) is equals
         assert (map0 != map1) is (not equals)
 
@@ -484,6 +561,23 @@ class TestModifyRow:
         assert map0.atomic_number[20].to_list() == ["Li", "Lithium", 20, [7, 6]]
         assert is_consistent(map0)
 
+    def test_assign_same_key_value(self):
+        """Assigning a key column its current value leaves the map unchanged."""
+        nan = float("nan")
+        map0 = get_default_map()
+        map0.update([["X", "Unknown", nan, []]])
+        orders = [list(key_dict) for key_dict in (map0.symbol, map0.name)]
+        row = map0["He"]
+        # Equal but not identical, which does not move the key
+        row.name = "".join(["He", "lium"])
+        # Identical but not equal to itself
+        map0["X"].atomic_number = nan
+        assert map0["He"] is row
+        assert map0.name["Helium"] is row
+        assert map0.atomic_number[nan] is map0["X"]
+        assert [list(key_dict) for key_dict in (map0.symbol, map0.name)] == orders
+        assert is_consistent(map0)
+
     def test_raise_duplicate_key_error(self):
         """Modify the value of a key column causing a KeyError."""
         map0 = get_default_map()
@@ -492,13 +586,89 @@ class TestModifyRow:
         assert is_consistent(map0)
 
 
+class TestRow:
+    """Test the behaviour of individual rows."""
+
+    @pytest.mark.parametrize(
+        "access",
+        [
+            lambda row: row.mass,
+            lambda row: row["mass"],
+            lambda row: setattr(row, "mass", 1),
+            lambda row: row.__setitem__("mass", 1),
+            lambda row: row["_parent"],
+        ],
+        ids=["getattr", "getitem", "setattr", "setitem", "getitem slot"],
+    )
+    def test_access_non_column(self, access):
+        """Anything that is not a column name raises an AttributeError."""
+        map0 = get_default_map()
+        with pytest.raises(AttributeError, match="object has no attribute"):
+            access(map0["H"])
+        assert map0 == get_reference_map()
+
+    def test_unpopulated_slot(self):
+        """A row whose slots are not set yet raises instead of recursing."""
+        row = object.__new__(type(get_reference_map()["H"]))
+        with pytest.raises(AttributeError):
+            row._values
+
+    def test_to_dict(self):
+        """Dump a row to a dict keyed by column."""
+        assert get_reference_map()["H"].to_dict() == {
+            "symbol": "H",
+            "name": "Hydrogen",
+            "atomic_number": 1,
+            "isotope_masses": [1, 2, 3],
+        }
+
+    def test_subscript(self):
+        """Read and write a row's entries by column name."""
+        map0 = get_default_map()
+        assert map0["Li"]["name"] == "Lithium"
+        map0["Li"]["atomic_number"] = 20
+        assert map0["Li"]["atomic_number"] == 20
+        assert map0.atomic_number[20] is map0["Li"]
+        assert is_consistent(map0)
+
+    def test_row_equality(self):
+        """Rows compare by their values and are not hashable."""
+        map0 = get_default_map()
+        map1 = get_default_map()
+        assert map0["H"] == map1["H"]
+        assert map0["H"] != map1["He"]
+        assert map0["H"] != ["H", "Hydrogen", 1, [1, 2, 3]]
+        assert map0["H"] == mock.ANY
+        with pytest.raises(TypeError):
+            hash(map0["H"])
+
+    def test_rows_share_slotted_class(self):
+        """Rows of maps with equal columns share one class without instance dict."""
+        map0 = get_default_map()
+        map1 = get_default_map(from_index=5, key_columns=2)
+        map2 = MultiDirMap(["a", "b"], data=[[1, 2]])
+        assert type(map0["H"]) is type(map1["C"])
+        assert type(map0["H"]) is not type(map2[1])
+        assert type(map0["H"]).__bases__ == type(map2[1]).__bases__
+        assert not hasattr(map0["H"], "__dict__")
+        with pytest.raises(AttributeError):
+            map0["H"].mass = 1
+
+    def test_column_named_like_row_attribute(self):
+        """Columns that clash with row attributes are still accessible."""
+        map0 = MultiDirMap(["_values", "to_list"], data=[[1, 2]])
+        assert map0[1]["_values"] == 1
+        assert map0[1]["to_list"] == 2
+        assert map0[1].to_list() == [1, 2]
+
+
 class TestClear:
     """Test clearing a MultiDirMap."""
 
     def test_clear(self):
         """Test the clear() method."""
         map0 = get_default_map()
-        map1 = get_default_map(from_index=0, to_index=0)
+        map1 = get_reference_map(from_index=0, to_index=0)
         map0.clear()
         assert len(map0) == 0
         assert map0 == map1
@@ -532,15 +702,19 @@ class TestSort:
     def test_default_sort(self):
         """Default sorting (by primary key column)."""
         map0 = get_default_map()
+        h = map0["H"]
+        symbols = map0.symbol
         map0.sort()
-        assert map0 == get_default_map()
+        assert map0 == get_reference_map()
+        assert map0["H"] is h
+        assert map0.symbol is symbols
         assert list(map0.keys()) == sorted(map0.keys())
 
     def test_custom_sort(self):
         """Sorting with custom comparator."""
         map0 = get_default_map()
         map0.sort(key=lambda entry: entry.atomic_number, reverse=True)
-        assert map0 == get_default_map()
+        assert map0 == get_reference_map()
         assert list(map0.atomic_number.keys()) == list(range(10, 0, -1))
 
 
@@ -567,7 +741,7 @@ class TestCopy:
 
 def test_to_list():
     """Test dumping the data of the MultiDirMap to a list of lists."""
-    assert get_default_map().to_list() == pte_data[1]
+    assert get_default_map().to_list() == [list(row) for row in pte_data[1]]
 
 
 def is_consistent(mdmap):
@@ -576,12 +750,12 @@ def is_consistent(mdmap):
     Specifically this tests that all key dicts have the same length and that
     each row is referred to by the appropriate key in each key dicts.
     """
-    cols = mdmap._columns
-    for col in cols[1 : mdmap._key_columns]:
-        if len(getattr(mdmap, col)) != len(mdmap):  # pragma: no cover
-            return False
-    for key, entry in mdmap.items():
-        for col in cols[1 : mdmap._key_columns]:
-            if getattr(mdmap, col)[getattr(entry, col)] != entry:  # pragma: no cover
+    key_cols = mdmap._columns[1 : mdmap._key_columns]
+    key_dicts = [getattr(mdmap, col) for col in key_cols]
+    if any(len(key_dict) != len(mdmap) for key_dict in key_dicts):  # pragma: no cover
+        return False
+    for entry in mdmap.values():
+        for col, key_dict in zip(key_cols, key_dicts):
+            if key_dict.get(getattr(entry, col)) is not entry:  # pragma: no cover
                 return False
     return True